@@ -0,0 +1,70 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from api.models import ServerTransition
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+
+
+def record_transition(**fields):
+    '''
+    Queues a ServerTransition to be written once the surrounding transaction commits.
+    Nothing is sent to the database here, so the transition itself pays no extra round trip,
+    and rolled back transitions are never logged. The callback is robust: the transition has
+    already committed, so a failure here must not turn the request into an error.
+    '''
+    event = ServerTransition(**fields)
+    transaction.on_commit(lambda: _append(event), robust=True)
+
+
+def _append(event):
+    # Buffered events are written when the batch fills up, or by a timer started with the
+    # first event of a batch so a quiet worker still writes its log within a few seconds
+    with _lock:
+        _buffer.append(event)
+        full = len(_buffer) >= settings.TRANSITION_LOG_BATCH_SIZE
+        if len(_buffer) == 1 and not full:
+            timer = threading.Timer(settings.TRANSITION_LOG_FLUSH_SECONDS, _flush_in_background)
+            timer.daemon = True
+            timer.start()
+    if full:
+        flush()
+
+
+def _flush_in_background():
+    try:
+        flush()
+    finally:
+        connection.close() # the timer thread's own connection
+
+
+def flush():
+    '''
+    Writes every buffered transition with a single bulk_create.
+    A batch that cannot be written is logged event by event instead of raising,
+    since flush runs after the transitions themselves have committed.
+    '''
+    global _buffer
+    with _lock:
+        events, _buffer = _buffer, []
+    if not events:
+        return
+    try:
+        ServerTransition.objects.bulk_create(events, batch_size=settings.TRANSITION_LOG_BATCH_SIZE)
+    except Exception:
+        logger.exception("Could not write %d server transitions", len(events))
+        for event in events:
+            logger.error(
+                "Lost server transition: server=%s %s -> %s device=%s reason=%r placement_ms=%s at %s",
+                event.server_id, event.from_status, event.to_status, event.device_id,
+                event.reason, event.placement_ms, event.created_at.isoformat(),
+            )
+
+
+# Don't lose the tail of the buffer when a worker shuts down cleanly
+atexit.register(flush)
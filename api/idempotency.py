@@ -0,0 +1,113 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from api.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def _client_id(request):
+    # Keys are scoped per client so two callers cannot replay each other's responses
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f"{request.method} {request.path} {body}".encode()).hexdigest()
+
+
+def _claim(client, key, fingerprint):
+    '''
+    Returns (record, created) for the client's key
+    1. Looks up an unexpired record, which is all a retried request costs
+    2. Otherwise inserts a pending record; concurrent retries block on the unique index
+       until the caller's transaction commits, then find the finished record
+    3. An expired record still holding the slot is deleted and the insert retried once
+    '''
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(client=client, key=key, expires_at__gt=now).first()
+    if record:
+        return record, False
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    client=client,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(client=client, key=key).first()
+            if record and record.expires_at > now:
+                return record, False
+            IdempotencyKey.objects.filter(client=client, key=key, expires_at__lte=now).delete()
+    raise IntegrityError(f"Could not claim idempotency key '{key}'")
+
+
+def idempotent(request, handler, *args, **kwargs):
+    '''
+    Runs handler once per Idempotency-Key and replays the stored response for retries.
+    Requests without the header are passed straight through.
+
+    The claim, the handler and the stored response share one transaction, so the key
+    and the work it guards commit together. A request that raises (including validation
+    errors) or whose worker is killed rolls back the claim and can simply be retried,
+    and a concurrent retry waits on the unique index until the first request finishes.
+    '''
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler(request, *args, **kwargs)
+    if len(key) > 255:
+        return Response(
+            {"detail": f"{IDEMPOTENCY_HEADER} must be at most 255 characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    fingerprint = _fingerprint(request)
+    with transaction.atomic():
+        record, created = _claim(_client_id(request), key, fingerprint)
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {"detail": f"{IDEMPOTENCY_HEADER} was already used with a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            return HttpResponse(
+                record.response_body,
+                status=record.response_status,
+                content_type='application/json',
+                headers={REPLAYED_HEADER: 'true'},
+            )
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code >= 500:
+            record.delete()
+            return response
+
+        record.response_status = response.status_code
+        record.response_body = JSONRenderer().render(response.data).decode()
+        record.save(update_fields=['response_status', 'response_body'])
+    return response
+
+
+class IdempotencyKeyMixin:
+    '''
+    Makes create and partial_update on a viewset honour the Idempotency-Key header
+    '''
+    def create(self, request, *args, **kwargs):
+        return idempotent(request, super().create, *args, **kwargs)
+
+    def partial_update(self, request, *args, **kwargs):
+        return idempotent(request, super().partial_update, *args, **kwargs)
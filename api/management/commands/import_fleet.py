@@ -0,0 +1,335 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from api.models import DEFAULT_POOL, SUBDOMAIN_FALLBACK_BASE, Device, Server, ServerStatus
+from api.placement import pool_order
+from api.serializers import BULK_CREATE_BATCH_SIZE
+
+TRUE_VALUES = ('true', '1', 't', 'yes', 'y')
+
+# Subdomains are always generated lowercase, so the lookups below compare them directly.
+# Each base continues numbering after the highest base-N already in api_server. Every existing
+# subdomain is split into (base, N) once, so existing numbers are found with a hash join
+# instead of matching each staged base against every row. Suffixes longer than 18 digits
+# cannot be a bigint; they are left out of the numbering and caught as collisions if needed.
+ALLOCATE_SUBDOMAINS_SQL = f'''
+CREATE TEMP TABLE import_subdomain ON COMMIT DROP AS
+WITH staged AS (
+    SELECT line, coalesce(
+        nullif(btrim(regexp_replace(lower(name), '[^a-z0-9]+', '-', 'g'), '-'), ''),
+        '{SUBDOMAIN_FALLBACK_BASE}'
+    ) AS base
+    FROM import_server
+),
+taken AS (
+    SELECT subdomain AS base, 0::bigint AS n FROM api_server
+    UNION ALL
+    SELECT regexp_replace(subdomain, '-[0-9]{{1,18}}$', ''), substring(subdomain FROM '-([0-9]{{1,18}})$')::bigint
+    FROM api_server
+    WHERE subdomain ~ '-[0-9]{{1,18}}$'
+),
+existing AS (
+    SELECT t.base, max(t.n) AS top
+    FROM (SELECT DISTINCT base FROM staged) b
+    JOIN taken t ON t.base = b.base
+    GROUP BY t.base
+),
+numbered AS (
+    SELECT st.line, st.base,
+           row_number() OVER (PARTITION BY st.base ORDER BY st.line) - 1 + coalesce(e.top + 1, 0) AS n
+    FROM staged st
+    LEFT JOIN existing e ON e.base = st.base
+)
+SELECT line, base, n,
+       CASE WHEN n = 0 THEN base ELSE base || '-' || n END AS subdomain,
+       false AS pending
+FROM numbered
+'''
+
+# Rare leftovers, e.g. a server named "web 1" next to a second "web": both want "web-1".
+# Later rows that collide are marked pending, then moved past the highest number used
+# for their base until none collide. Only pending rows are rechecked after the first pass.
+MARK_COLLISIONS_SQL = '''
+UPDATE import_subdomain SET pending = true
+WHERE line IN (
+    SELECT line FROM (
+        SELECT line, subdomain, row_number() OVER (PARTITION BY subdomain ORDER BY line) AS dup
+        FROM import_subdomain
+    ) ranked
+    WHERE dup > 1 OR EXISTS (SELECT 1 FROM api_server s WHERE s.subdomain = ranked.subdomain)
+)
+'''
+
+BUMP_PENDING_SQL = '''
+WITH tops AS (
+    SELECT base, max(n) AS top FROM import_subdomain
+    WHERE base IN (SELECT base FROM import_subdomain WHERE pending)
+    GROUP BY base
+),
+bumped AS (
+    SELECT p.line, t.top + row_number() OVER (PARTITION BY p.base ORDER BY p.line) AS n
+    FROM import_subdomain p
+    JOIN tops t ON t.base = p.base
+    WHERE p.pending
+)
+UPDATE import_subdomain i
+SET n = b.n, subdomain = i.base || '-' || b.n
+FROM bumped b
+WHERE b.line = i.line
+'''
+
+CLEAR_RESOLVED_SQL = '''
+UPDATE import_subdomain i SET pending = false
+WHERE i.pending
+  AND NOT EXISTS (SELECT 1 FROM import_subdomain j WHERE j.subdomain = i.subdomain AND j.line <> i.line)
+  AND NOT EXISTS (SELECT 1 FROM api_server s WHERE s.subdomain = i.subdomain)
+'''
+
+# Device names are not unique, so references resolve to the oldest device with that name
+FIRST_DEVICE_BY_NAME_SQL = '(SELECT DISTINCT ON (name) name, id, pool FROM api_device ORDER BY name, id)'
+
+
+def _read_rows(path):
+    '''
+    Streams (line number, row dict) pairs from a .jsonl file or a CSV file with a header row
+    '''
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                for line, text in enumerate(f, 1):
+                    if text.strip():
+                        yield line, json.loads(text)
+            else:
+                yield from enumerate(csv.DictReader(f), 2)
+    except (OSError, ValueError) as exc:
+        raise CommandError(f"{path}: {exc}")
+
+
+def _parse_bool(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _pool(path, line, row):
+    pool = (row.get('pool') or '').strip() or DEFAULT_POOL
+    if len(pool) > 64:
+        raise CommandError(f"{path}:{line}: pool must be at most 64 characters.")
+    return pool
+
+
+def _device_rows(path):
+    for line, row in _read_rows(path):
+        name = (row.get('name') or '').strip()
+        if not name or len(name) > 255:
+            raise CommandError(f"{path}:{line}: device name must be 1 to 255 characters.")
+        yield line, name, _pool(path, line, row), _parse_bool(row.get('is_online'))
+
+
+def _server_rows(path):
+    for line, row in _read_rows(path):
+        name = (row.get('name') or '').strip()
+        if not (3 <= len(name) <= 50):
+            raise CommandError(f"{path}:{line}: server name must be between 3 and 50 characters.")
+        status = row.get('status') or ServerStatus.STOPPED
+        if status not in ServerStatus.values:
+            raise CommandError(f"{path}:{line}: unknown status '{status}'.")
+        if status == ServerStatus.STARTING:
+            raise CommandError(f"{path}:{line}: status 'starting' is transient and cannot be imported.")
+        device = (row.get('device') or '').strip() or None
+        # Same invariant the API keeps: only running servers are placed on a device
+        if (status == ServerStatus.RUNNING) != (device is not None):
+            raise CommandError(f"{path}:{line}: a server needs a device if and only if it is running.")
+        yield line, name, _pool(path, line, row), status, device
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports devices and servers from CSV or JSONL files. "
+        "Device columns: name, pool, is_online. Server columns: name, pool, status, device (a device name). "
+        "Devices whose name already exists are skipped. Everything is loaded in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', help="CSV or .jsonl file of devices")
+        parser.add_argument('--servers', help="CSV or .jsonl file of servers")
+        parser.add_argument('--progress-every', type=int, default=100000,
+                            help="Report progress after this many rows")
+
+    def handle(self, *args, devices, servers, progress_every, **options):
+        if not devices and not servers:
+            raise CommandError("Pass --devices and/or --servers.")
+        self.progress_every = progress_every
+        self.reported = {} # label -> count at the last progress check
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                created = self._import_copy(devices, servers)
+            else:
+                created = self._import_orm(devices, servers)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created[0]} devices and {created[1]} servers"
+        ))
+
+    def _progress(self, count, label):
+        # The ORM path counts a batch at a time, so report whenever a multiple was passed
+        last = self.reported.get(label, 0)
+        if count // self.progress_every > last // self.progress_every:
+            self.stdout.write(f"  {count} {label}")
+        self.reported[label] = count
+
+    def _check_pool(self, path, line, pool, device_name, device_pool):
+        # Placement only puts a server on a device in its pool or the pool's fallbacks
+        if device_pool not in pool_order(pool):
+            raise CommandError(
+                f"{path}:{line}: device '{device_name}' is in pool '{device_pool}', "
+                f"not in pool '{pool}' or its fallbacks."
+            )
+
+    def _copy(self, cursor, sql, rows, label):
+        count = 0
+        with cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+                count += 1
+                self._progress(count, label)
+        return count
+
+    def _import_copy(self, devices_path, servers_path):
+        '''
+        PostgreSQL path
+        1. COPY each file into a temporary staging table
+        2. Insert devices whose names are new
+        3. Allocate server subdomains and resolve device names with set-based SQL
+        4. Insert servers in input order
+        '''
+        created_devices = created_servers = 0
+        with connection.cursor() as wrapper:
+            cursor = wrapper.cursor # psycopg cursor, needed for COPY
+            if devices_path:
+                cursor.execute('DROP TABLE IF EXISTS import_device')
+                cursor.execute(
+                    'CREATE TEMP TABLE import_device (line bigint, name text, pool text, is_online boolean) '
+                    'ON COMMIT DROP'
+                )
+                staged = self._copy(
+                    cursor,
+                    'COPY import_device (line, name, pool, is_online) FROM STDIN',
+                    _device_rows(devices_path),
+                    "devices staged",
+                )
+                self.stdout.write(f"Staged {staged} devices")
+                cursor.execute('''
+                    INSERT INTO api_device (name, pool, is_online, last_seen, version)
+                    SELECT name, pool, is_online, now(), 1 FROM (
+                        SELECT DISTINCT ON (i.name) i.line, i.name, i.pool, i.is_online
+                        FROM import_device i
+                        WHERE NOT EXISTS (SELECT 1 FROM api_device d WHERE d.name = i.name)
+                        ORDER BY i.name, i.line
+                    ) new_devices
+                    ORDER BY line
+                ''')
+                created_devices = cursor.rowcount
+
+            if servers_path:
+                cursor.execute('DROP TABLE IF EXISTS import_server, import_subdomain')
+                cursor.execute(
+                    'CREATE TEMP TABLE import_server ('
+                    'line bigint, name text, pool text, status text, device_name text) ON COMMIT DROP'
+                )
+                staged = self._copy(
+                    cursor,
+                    'COPY import_server (line, name, pool, status, device_name) FROM STDIN',
+                    _server_rows(servers_path),
+                    "servers staged",
+                )
+                self.stdout.write(f"Staged {staged} servers")
+
+                cursor.execute(f'''
+                    SELECT count(*) FROM import_server i
+                    LEFT JOIN {FIRST_DEVICE_BY_NAME_SQL} d ON d.name = i.device_name
+                    WHERE i.device_name IS NOT NULL AND d.id IS NULL
+                ''')
+                unresolved = cursor.fetchone()[0]
+                if unresolved:
+                    raise CommandError(f"{unresolved} servers reference devices that do not exist.")
+                cursor.execute(f'''
+                    SELECT min(i.line), i.pool, i.device_name, d.pool FROM import_server i
+                    JOIN {FIRST_DEVICE_BY_NAME_SQL} d ON d.name = i.device_name
+                    WHERE d.pool <> i.pool
+                    GROUP BY i.pool, i.device_name, d.pool
+                    ORDER BY 1
+                ''')
+                for line, pool, device_name, device_pool in cursor.fetchall():
+                    self._check_pool(servers_path, line, pool, device_name, device_pool)
+
+                cursor.execute(ALLOCATE_SUBDOMAINS_SQL)
+                cursor.execute('CREATE UNIQUE INDEX ON import_subdomain (line)')
+                cursor.execute('CREATE INDEX ON import_subdomain (subdomain)')
+                cursor.execute('ANALYZE import_subdomain')
+                cursor.execute(MARK_COLLISIONS_SQL)
+                pending = cursor.rowcount
+                while pending:
+                    cursor.execute(BUMP_PENDING_SQL)
+                    cursor.execute(CLEAR_RESOLVED_SQL)
+                    pending -= cursor.rowcount
+                self.stdout.write("Allocated subdomains")
+
+                cursor.execute(f'''
+                    INSERT INTO api_server (name, subdomain, pool, status, device_id, created_at, version)
+                    SELECT i.name, a.subdomain, i.pool, i.status, d.id, now(), 1
+                    FROM import_server i
+                    JOIN import_subdomain a ON a.line = i.line
+                    LEFT JOIN {FIRST_DEVICE_BY_NAME_SQL} d ON d.name = i.device_name
+                    ORDER BY i.line
+                ''')
+                created_servers = cursor.rowcount
+        return created_devices, created_servers
+
+    def _import_orm(self, devices_path, servers_path):
+        '''
+        Fallback for other databases (e.g. SQLite): chunked bulk_create through the ORM
+        '''
+        created_devices = created_servers = 0
+        if devices_path:
+            known = set(Device.objects.values_list('name', flat=True))
+            batch = []
+            for _, name, pool, is_online in _device_rows(devices_path):
+                if name in known:
+                    continue
+                known.add(name)
+                batch.append(Device(name=name, pool=pool, is_online=is_online))
+                if len(batch) == BULK_CREATE_BATCH_SIZE:
+                    created_devices += len(Device.objects.bulk_create(batch))
+                    batch = []
+                    self._progress(created_devices, "devices imported")
+            created_devices += len(Device.objects.bulk_create(batch))
+
+        if servers_path:
+            # Oldest device wins when several share a name, matching the COPY path
+            devices = {name: (pk, pool) for pk, name, pool in Device.objects.order_by('-id').values_list('id', 'name', 'pool')}
+            rows = []
+            for line, name, pool, status, device_name in _server_rows(servers_path):
+                device_id = None
+                if device_name:
+                    if device_name not in devices:
+                        raise CommandError(f"{servers_path}:{line}: device '{device_name}' does not exist.")
+                    device_id, device_pool = devices[device_name]
+                    self._check_pool(servers_path, line, pool, device_name, device_pool)
+                rows.append((name, pool, status, device_id))
+                if len(rows) == BULK_CREATE_BATCH_SIZE:
+                    created_servers += self._create_servers(rows)
+                    rows = []
+                    self._progress(created_servers, "servers imported")
+            created_servers += self._create_servers(rows)
+        return created_devices, created_servers
+
+    def _create_servers(self, rows):
+        subdomains = Server.allocate_subdomains([name for name, _, _, _ in rows])
+        servers = [
+            Server(name=name, pool=pool, status=status, device_id=device_id, subdomain=subdomain)
+            for (name, pool, status, device_id), subdomain in zip(rows, subdomains)
+        ]
+        return len(Server.objects.bulk_create(servers))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Deletes expired idempotency keys in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, batch_size, **options):
+        now = timezone.now()
+        deleted = 0
+        # Batches keep each delete short so it never holds locks against live requests for long
+        while True:
+            ids = list(
+                IdempotencyKey.objects
+                .filter(expires_at__lte=now)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
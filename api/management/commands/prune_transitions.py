@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import ServerTransition
+
+
+class Command(BaseCommand):
+    help = "Deletes server transition events older than the retention period in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRANSITION_LOG_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, days, batch_size, **options):
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted = 0
+        # The oldest rows sit together at the start of the created_at index, so each batch is a short range scan
+        while True:
+            ids = list(
+                ServerTransition.objects
+                .filter(created_at__lt=cutoff)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted += ServerTransition.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} transition events older than {days} days")
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api import history
+from api.rebalance import apply_moves, plan_server_moves
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves running servers from the busiest online devices to the idlest ones in the "
+        "same pool until every pool's running counts are within the tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tolerance', type=int, default=1,
+                            help="Largest allowed difference in running servers between two devices in a pool")
+        parser.add_argument('--max-moves', type=int, default=500,
+                            help="Most servers moved per cycle")
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help="Servers moved per transaction")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Print the planned moves without applying them")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep rebalancing every --interval seconds")
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, tolerance, max_moves, batch_size, pause, dry_run, loop, interval, **options):
+        if tolerance < 1 or max_moves < 1 or batch_size < 1:
+            raise CommandError("--tolerance, --max-moves and --batch-size must be at least 1.")
+        while True:
+            self._cycle(tolerance, max_moves, batch_size, pause, dry_run)
+            if not loop:
+                break
+            time.sleep(interval)
+
+    def _cycle(self, tolerance, max_moves, batch_size, pause, dry_run):
+        moves = plan_server_moves(tolerance, max_moves)
+        if dry_run:
+            for move in moves:
+                self.stdout.write(f"Move server {move.server} from device {move.source} to device {move.target}")
+            self.stdout.write(f"Planned {len(moves)} moves")
+            return
+        moved = 0
+        for start in range(0, len(moves), batch_size):
+            if start and pause:
+                time.sleep(pause)
+            moved += apply_moves(moves[start:start + batch_size], batch_size)
+        history.flush()
+        self.stdout.write(f"Moved {moved} of {len(moves)} planned servers")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.simulator import Simulation, read_trace, synthetic_trace
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a trace of server and device events against the placement policy in memory "
+        "and reports device load, error rate and decisions per second. No database is used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trace', help="JSON Lines file of events; a synthetic trace is generated if omitted")
+        parser.add_argument('--events', type=int, default=1000000, help="Synthetic events to generate")
+        parser.add_argument('--devices', type=int, default=100, help="Devices that join a synthetic trace up front")
+        parser.add_argument('--pools', type=int, default=1, help="Pools in a synthetic trace")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, trace, events, devices, pools, seed, **options):
+        if trace:
+            try:
+                report = Simulation().run(read_trace(trace)).report()
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"{trace}: {exc}")
+        else:
+            if devices < 1 or pools < 1:
+                raise CommandError("--devices and --pools must be at least 1.")
+            # Generate the trace up front so generation time is not counted as simulation time
+            report = Simulation().run(list(synthetic_trace(events, devices, pools, seed))).report()
+
+        self.stdout.write(
+            f"Events: {report['events']} in {report['seconds']:.2f}s "
+            f"({report['events_per_second']:.0f}/s)"
+        )
+        self.stdout.write(
+            f"Placement decisions: {report['decisions']} ({report['decisions_per_second']:.0f}/s), "
+            f"errors: {report['errors']} ({report['error_rate']:.2%}), "
+            f"rejected events: {report['rejected']}"
+        )
+        self.stdout.write(
+            f"Running servers per online device ({report['online_devices']} devices, "
+            f"{report['running_servers']} running): min {report['load_min']}, "
+            f"mean {report['load_mean']:.1f}, max {report['load_max']}, "
+            f"stdev {report['load_stdev']:.1f}"
+        )
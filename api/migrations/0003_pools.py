@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='pool',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='pool',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['pool', 'is_online', 'last_seen'], name='device_placement_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_pools'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServerTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('stopped', 'Stopped'), ('starting', 'Starting'), ('running', 'Running'), ('error', 'Error')], max_length=10)),
+                ('to_status', models.CharField(choices=[('stopped', 'Stopped'), ('starting', 'Starting'), ('running', 'Running'), ('error', 'Error')], max_length=10)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('placement_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.device')),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='api.server')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['server', '-created_at'], name='transition_server_time_idx'), models.Index(fields=['created_at'], name='transition_time_idx')],
+            },
+        ),
+    ]
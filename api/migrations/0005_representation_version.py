@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_servertransition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
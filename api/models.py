@@ -1,10 +1,67 @@
 from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
 import re
 
+# Base for names made only of punctuation, whose base would otherwise be empty
+SUBDOMAIN_FALLBACK_BASE = 'server'
+# Bases checked per collision query in Server.allocate_subdomains
+SUBDOMAIN_LOOKUP_BATCH = 500
+
+def _subdomain_base(name):
+    # Create the base subdomain from the name
+    return re.sub(r'[^a-zA-Z0-9]+', '-', name.lower()).strip('-') or SUBDOMAIN_FALLBACK_BASE
+
+
+def _subdomain_candidates(name):
+    '''
+    Yields the subdomains to try for a name, in order: the base, then base-1, base-2, ...
+    '''
+    base = _subdomain_base(name)
+    yield base
+    num = 1
+    while True:
+        yield f"{base}-{num}"
+        num += 1
+
+
+DEFAULT_POOL = 'default'
+
+
+def _bump_version(instance, save_kwargs):
+    '''
+    Makes the coming save of an existing row increment version in the database rather than
+    in Python, so concurrent writes to one row never share a version. Returns whether the
+    caller must drop the F() expression after saving. Updates that bypass save(), like
+    queryset.update(), must bump version themselves.
+    '''
+    if instance._state.adding:
+        return False
+    instance.version = F('version') + 1
+    if save_kwargs.get('update_fields') is not None:
+        save_kwargs['update_fields'] = {*save_kwargs['update_fields'], 'version'}
+    return True
+
+
 class Device(models.Model):
     name = models.CharField(max_length=255)
+    pool = models.CharField(max_length=64, default=DEFAULT_POOL) # placement only considers devices in the server's pool
     is_online = models.BooleanField(default=True)
     last_seen = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1) # bumped on every save, keys cached representations
+
+    class Meta:
+        indexes = [
+            # Matches the placement query, so its cost depends on pool size rather than fleet size
+            models.Index(fields=['pool', 'is_online', 'last_seen'], name='device_placement_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        bumped = _bump_version(self, kwargs)
+        super().save(*args, **kwargs)
+        if bumped:
+            # Deferred rather than refreshed, so the new value is only read if something asks for it
+            self.__dict__.pop('version', None)
 
     def __str__(self):
         return f"Device({self.id}): {self.name}"
@@ -31,6 +88,7 @@ class ServerStatus(models.TextChoices):
 class Server(models.Model):
     name = models.CharField(max_length=50)
     subdomain = models.CharField(max_length=60, unique=True)
+    pool = models.CharField(max_length=64, default=DEFAULT_POOL)
     status = models.CharField(
         max_length=10,
         choices=ServerStatus.choices,
@@ -44,12 +102,16 @@ class Server(models.Model):
         related_name="servers",
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=1) # bumped on every save, keys cached representations
 
     def save(self, *args, **kwargs):
         # Automatically regenerates the subdomain when the name of the server is changed
         if not self.pk or Server.objects.get(pk=self.pk).name != self.name:
             self.subdomain = self._generate_subdomain()
+        bumped = _bump_version(self, kwargs)
         super().save(*args, **kwargs)
+        if bumped:
+            self.__dict__.pop('version', None)
 
     def _generate_subdomain(self):
         '''
@@ -58,15 +120,91 @@ class Server(models.Model):
         2. Replaces spaces and special characters with hyphens
         3. Appends a number if the subdomain generated already exists
         '''
-        # Create the base subdomain from the name
-        base = re.sub(r'[^a-zA-Z0-9]+', '-', self.name.lower()).strip('-')
-        subdomain = base
-        num = 1
         # Checks for uniqueness and appends a number if a collision is found
-        while Server.objects.filter(subdomain__iexact=subdomain).exclude(pk=self.pk).exists():
-            subdomain = f"{subdomain}-{num}"
-            num += 1
-        return subdomain
+        for subdomain in _subdomain_candidates(self.name):
+            if not Server.objects.filter(subdomain__iexact=subdomain).exclude(pk=self.pk).exists():
+                return subdomain
+
+    @classmethod
+    def allocate_subdomains(cls, names):
+        '''
+        Generates subdomains for a batch of new servers, in the same order as names,
+        using one query per SUBDOMAIN_LOOKUP_BATCH distinct bases for all existing subdomains
+        that could collide instead of probing the database once per candidate like _generate_subdomain
+        '''
+        bases = sorted({_subdomain_base(name) for name in names})
+        taken = set()
+        for start in range(0, len(bases), SUBDOMAIN_LOOKUP_BATCH):
+            chunk = bases[start:start + SUBDOMAIN_LOOKUP_BATCH]
+            # Subdomains are always generated lowercase, so exact and prefix matches find every
+            # collision and can use the unique index and its LIKE index
+            collisions = Q(subdomain__in=chunk)
+            for base in chunk:
+                collisions |= Q(subdomain__startswith=f"{base}-")
+            taken.update(cls.objects.filter(collisions).values_list('subdomain', flat=True))
+        subdomains = []
+        for name in names:
+            for subdomain in _subdomain_candidates(name):
+                if subdomain not in taken:
+                    break
+            taken.add(subdomain)
+            subdomains.append(subdomain)
+        return subdomains
+
+    def __str__(self):
+        return f"Server({self.id}): {self.name} [{self.status}]"
+
+class IdempotencyKey(models.Model):
+    '''
+    Stores the response to a request made with an Idempotency-Key header so a retried
+    request can be answered from this row instead of being processed again.
+    Rows are only committed together with their response, see api.idempotency.idempotent.
+    '''
+    client = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64) # hash of method, path and body, rejects key reuse
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True) # only null inside the claiming transaction
+    response_body = models.TextField(blank=True) # rendered JSON, replayed byte for byte
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'key'], name='unique_idempotency_key_per_client'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']), # keeps pruning expired keys an index range scan
+        ]
+
+    def __str__(self):
+        return f"IdempotencyKey({self.client}, {self.key})"
+
+
+class ServerTransition(models.Model):
+    '''
+    Append-only log of server status transitions. Rows are buffered and written in
+    batches by api.history, so created_at is set when the transition happens rather
+    than when the row is inserted.
+    '''
+    server = models.ForeignKey(to=Server, on_delete=models.CASCADE, related_name="transitions")
+    from_status = models.CharField(max_length=10, choices=ServerStatus.choices)
+    to_status = models.CharField(max_length=10, choices=ServerStatus.choices)
+    device = models.ForeignKey(
+        to=Device,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    reason = models.CharField(max_length=255, blank=True) # why placement failed, if it did
+    placement_ms = models.FloatField(null=True, blank=True) # time spent choosing a device on start
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['server', '-created_at'], name='transition_server_time_idx'), # per-server history
+            models.Index(fields=['created_at'], name='transition_time_idx'), # time-range queries and pruning
+        ]
 
     def __str__(self):
-        return f"Server({self.id}): {self.name} [{self.status}]"
\ No newline at end of file
+        return f"ServerTransition({self.server_id}): {self.from_status} -> {self.to_status}"
@@ -0,0 +1,42 @@
+from django.conf import settings
+from api.models import Device
+
+
+def pool_order(pool):
+    '''
+    Returns the pools to try, in order, when placing a server from pool:
+    the pool itself, then its fallbacks from settings.POOL_FALLBACKS
+    '''
+    fallbacks = settings.POOL_FALLBACKS.get(pool, [])
+    return [pool] + [p for p in fallbacks if p != pool]
+
+
+def choose_device(pool, first_online):
+    '''
+    Placement policy shared by the API and the simulator: walks pool_order(pool) and
+    returns the first device first_online(pool) offers, or None if no pool has one.
+    first_online must return the least recently seen online device in a pool.
+    '''
+    for candidate in pool_order(pool):
+        device = first_online(candidate)
+        if device is not None:
+            return device
+    return None
+
+
+def _lock_first_online(pool):
+    return (
+        Device.objects
+        .filter(pool=pool, is_online=True)
+        .select_for_update(skip_locked=True)
+        .order_by("last_seen")
+        .first()
+    )
+
+
+def select_device(pool):
+    '''
+    Locks and returns the device a server starting in pool should be placed on.
+    Each query only scans and locks rows in one pool.
+    '''
+    return choose_device(pool, _lock_first_online)
@@ -0,0 +1,145 @@
+import heapq
+from collections import defaultdict, namedtuple
+from django.db import transaction
+from django.db.models import Count, Exists, F, Q, Subquery
+from api import representation_cache
+from api.history import record_transition
+from api.models import Device, Server, ServerStatus
+from api.placement import pool_order
+
+Move = namedtuple('Move', ['server', 'source', 'target'])
+
+
+def device_loads():
+    '''
+    Returns {pool: {device id: running server count}} for every online device,
+    using a single aggregate query
+    '''
+    rows = (
+        Device.objects
+        .filter(is_online=True)
+        .annotate(running=Count('servers', filter=Q(servers__status=ServerStatus.RUNNING)))
+        .values_list('pool', 'id', 'running')
+    )
+    loads = defaultdict(dict)
+    for pool, device_id, running in rows:
+        loads[pool][device_id] = running
+    return loads
+
+
+def plan_moves(loads, tolerance=1, max_moves=None):
+    '''
+    Plans the moves that bring one pool's loads within tolerance of each other
+    1. Takes the busiest and the idlest device
+    2. Stops if their counts differ by no more than tolerance
+    3. Otherwise moves one server from the busiest to the idlest and repeats
+    Returns a list of (source device, target device) pairs
+    '''
+    tolerance = max(tolerance, 1) # a spread of 1 cannot be improved by moving whole servers
+    counts = dict(loads)
+    busiest = [(-count, device) for device, count in counts.items()]
+    idlest = [(count, device) for device, count in counts.items()]
+    heapq.heapify(busiest)
+    heapq.heapify(idlest)
+    moves = []
+    while counts and (max_moves is None or len(moves) < max_moves):
+        # Heaps keep old entries after a count changes; skip the stale ones
+        while -busiest[0][0] != counts[busiest[0][1]]:
+            heapq.heappop(busiest)
+        while idlest[0][0] != counts[idlest[0][1]]:
+            heapq.heappop(idlest)
+        source, target = busiest[0][1], idlest[0][1]
+        if counts[source] - counts[target] <= tolerance:
+            break
+        counts[source] -= 1
+        counts[target] += 1
+        for device in (source, target):
+            heapq.heappush(busiest, (-counts[device], device))
+            heapq.heappush(idlest, (counts[device], device))
+        moves.append((source, target))
+    return moves
+
+
+def plan_server_moves(tolerance=1, max_moves=None):
+    '''
+    Plans moves for every pool, up to max_moves in total, and picks the running
+    servers to move. A server is only given a target in its own pool or one of
+    the pool's fallbacks, so servers never leave their pool.
+    '''
+    device_moves = []
+    for pool, pool_loads in device_loads().items():
+        remaining = None if max_moves is None else max_moves - len(device_moves)
+        if remaining == 0:
+            break
+        device_moves += [(source, target, pool) for source, target in plan_moves(pool_loads, tolerance, remaining)]
+
+    targets = defaultdict(list)
+    for source, target, pool in device_moves:
+        targets[source].append((target, pool))
+    moves = []
+    for source, source_targets in targets.items():
+        servers = list(
+            Server.objects
+            .filter(device_id=source, status=ServerStatus.RUNNING)
+            .order_by('-id')
+            .values_list('id', 'pool')
+        )
+        for target, target_pool in source_targets:
+            for i, (server, server_pool) in enumerate(servers):
+                if target_pool in pool_order(server_pool):
+                    moves.append(Move(server, source, target))
+                    del servers[i]
+                    break
+    return moves
+
+
+def apply_moves(moves, batch_size=100):
+    '''
+    Reassigns servers according to moves, batch_size servers per transaction.
+    Servers that are locked, stopped or already moved since planning are skipped, and so
+    are moves whose target has since gone offline or left the source device's pool.
+    Returns the number of servers moved.
+    '''
+    moved = 0
+    for start in range(0, len(moves), batch_size):
+        batch = moves[start:start + batch_size]
+        with transaction.atomic():
+            current = dict(
+                Server.objects
+                .select_for_update(skip_locked=True)
+                .filter(pk__in=[move.server for move in batch], status=ServerStatus.RUNNING)
+                .values_list('id', 'device_id')
+            )
+            by_device = defaultdict(list)
+            for move in batch:
+                if current.get(move.server) == move.source:
+                    by_device[move.source, move.target].append(move)
+            for (source, target), device_moves in by_device.items():
+                servers = [move.server for move in device_moves]
+                # The target is checked inside the UPDATE rather than locked, since placement
+                # skips locked devices and would fail starts in the pool while a batch is open
+                target_ok = Device.objects.filter(
+                    pk=target,
+                    is_online=True,
+                    pool=Subquery(Device.objects.filter(pk=source).values('pool')[:1]),
+                )
+                # update() skips save(), so bump version here to keep cached representations fresh
+                count = (
+                    Server.objects
+                    .filter(pk__in=servers, device_id=source, status=ServerStatus.RUNNING)
+                    .filter(Exists(target_ok))
+                    .update(device_id=target, version=F('version') + 1)
+                )
+                if not count:
+                    continue
+                moved += count
+                representation_cache.invalidate('server', servers)
+                for move in device_moves:
+                    record_transition(
+                        server_id=move.server,
+                        from_status=ServerStatus.RUNNING,
+                        to_status=ServerStatus.RUNNING,
+                        device_id=target,
+                        reason=f"Rebalanced from device {source}.",
+                    )
+    return moved
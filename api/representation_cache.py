@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from api.models import Device, Server
+
+# key -> (version, base URL, rendered JSON), least recently used first
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0}
+
+
+def _key(label, pk):
+    return f"repr:{label}:{pk}"
+
+
+def _shared():
+    alias = settings.REPRESENTATION_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def enabled():
+    return settings.REPRESENTATION_CACHE_SIZE > 0 or bool(settings.REPRESENTATION_CACHE_ALIAS)
+
+
+def get_many(label, versions, base):
+    '''
+    Returns {pk: fragment} for the (pk, version) pairs in versions whose cached
+    fragment was rendered at that version for the same base URL (detail_url is absolute).
+    Looks in the process's LRU first, then in the shared backend if one is configured.
+    '''
+    wanted = {_key(label, pk): (pk, version) for pk, version in versions}
+    found = {}
+    missing = []
+    with _lock:
+        for key, (pk, version) in wanted.items():
+            entry = _entries.get(key)
+            if entry is not None and entry[:2] == (version, base):
+                _entries.move_to_end(key)
+                found[pk] = entry[2]
+            else:
+                missing.append(key)
+    shared = _shared()
+    if missing and shared is not None:
+        promoted = {}
+        for key, entry in shared.get_many(missing).items():
+            pk, version = wanted[key]
+            if entry[:2] == (version, base):
+                found[pk] = entry[2]
+                promoted[key] = entry
+        _store(promoted)
+    with _lock:
+        _stats['hits'] += len(found)
+        _stats['misses'] += len(wanted) - len(found)
+        _stats['bytes_saved'] += sum(len(fragment) for fragment in found.values())
+    return found
+
+
+def set_many(label, rendered, base):
+    '''
+    Caches fragments given as {pk: (version, fragment)}
+    '''
+    entries = {_key(label, pk): (version, base, fragment) for pk, (version, fragment) in rendered.items()}
+    if not entries:
+        return
+    _store(entries)
+    shared = _shared()
+    if shared is not None:
+        shared.set_many(entries, timeout=settings.REPRESENTATION_CACHE_TIMEOUT)
+
+
+def _store(entries):
+    size = settings.REPRESENTATION_CACHE_SIZE
+    if size <= 0:
+        return
+    with _lock:
+        for key, entry in entries.items():
+            _entries[key] = entry
+            _entries.move_to_end(key)
+        while len(_entries) > size:
+            _entries.popitem(last=False)
+
+
+def invalidate(label, pks):
+    '''
+    Drops cached fragments for rows that changed. Reads compare versions, so this only
+    frees the entries early; updates that bypass save() must still bump version.
+    '''
+    keys = [_key(label, pk) for pk in pks]
+    with _lock:
+        for key in keys:
+            _entries.pop(key, None)
+    shared = _shared()
+    if keys and shared is not None:
+        shared.delete_many(keys)
+
+
+def stats():
+    '''
+    Hit rate and bytes served from cache instead of being serialized, for this process
+    '''
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return {
+            **_stats,
+            'hit_rate': _stats['hits'] / lookups if lookups else 0.0,
+            'entries': len(_entries),
+        }
+
+
+def clear():
+    '''
+    Empties the process's LRU and resets its stats, leaving the shared backend alone
+    '''
+    with _lock:
+        _entries.clear()
+        _stats.update(hits=0, misses=0, bytes_saved=0)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Server)
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Server)
+def _invalidate_instance(sender, instance, **kwargs):
+    # Covers API updates, status transitions and anything else that goes through save()
+    invalidate(sender._meta.model_name, [instance.pk])
+
+
+@receiver(pre_delete, sender=Device)
+def _invalidate_device_servers(sender, instance, **kwargs):
+    # SET_NULL clears Server.device with update(), which skips save() and its version bump
+    servers = list(instance.servers.values_list('id', flat=True))
+    if servers:
+        Server.objects.filter(pk__in=servers).update(version=F('version') + 1)
+        invalidate('server', servers)
@@ -1,7 +1,62 @@
+import time
 from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Device, Server, ServerStatus
+from .models import Device, Server, ServerStatus, ServerTransition
+from .history import record_transition
+from .placement import pool_order, select_device
+
+# Rows per INSERT when a list of devices or servers is registered in one request
+BULK_CREATE_BATCH_SIZE = 500
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    default_error_messages = {
+        'max_length': "Send at most {max_length} items per request; use the import_fleet command for larger loads.",
+    }
+
+
+class DeviceListSerializer(BulkListSerializer):
+    @transaction.atomic
+    def create(self, validated_data):
+        # Inserts the whole batch with bulk_create instead of one INSERT per device
+        devices = [Device(**attrs) for attrs in validated_data]
+        return Device.objects.bulk_create(devices, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+class ServerListSerializer(BulkListSerializer):
+    @transaction.atomic
+    def create(self, validated_data):
+        # Bypasses Server.save so subdomains are allocated for the batch from a single query
+        subdomains = Server.allocate_subdomains([attrs["name"] for attrs in validated_data])
+        servers = [
+            Server(**attrs, subdomain=subdomain)
+            for attrs, subdomain in zip(validated_data, subdomains)
+        ]
+        return Server.objects.bulk_create(servers, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+class ServerTransitionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ServerTransition
+        fields = (
+            'id',
+            'from_status',
+            'to_status',
+            'device',
+            'reason',
+            'placement_ms',
+            'created_at',
+        )
+        read_only_fields = fields
+
+
+class RepresentationCacheStatsSerializer(serializers.Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_rate = serializers.FloatField()
+    bytes_saved = serializers.IntegerField() # size of fragments served without serializing
+    entries = serializers.IntegerField() # rows held in this process's LRU
 
 
 class DeviceSerializer(serializers.ModelSerializer):
@@ -12,6 +67,7 @@ class DeviceSerializer(serializers.ModelSerializer):
             'detail_url', # Allows someone browsing web api to go directly to a device instance listed
             'id', 
             'name',
+            'pool',
             'is_online', 
             'last_seen',
         )
@@ -19,6 +75,14 @@ class DeviceSerializer(serializers.ModelSerializer):
             'id',
             'last_seen', # this status will be updated by the system automatically
         ) 
+        list_serializer_class = DeviceListSerializer
+
+    def validate_pool(self, pool):
+        # Running servers must stay on a device in their pool or its fallbacks
+        instance: Device = self.instance
+        if instance and pool != instance.pool and instance.servers.filter(status=ServerStatus.RUNNING).exists():
+            raise serializers.ValidationError("Stop or move the device's running servers before changing its pool.")
+        return pool
     
 
 class ServerSerializer(serializers.ModelSerializer):
@@ -30,6 +94,7 @@ class ServerSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'subdomain',
+            'pool',
             'status',
             'device',
             'created_at',
@@ -40,12 +105,20 @@ class ServerSerializer(serializers.ModelSerializer):
             'device', # managed by the system based on server status transtitions
             'created_at', # automatically set when the server is first created
         )
+        list_serializer_class = ServerListSerializer
 
     def validate_name(self, name):
         if not (3 <= len(name) <= 50):
             raise serializers.ValidationError("Server name must be between 3 and 50 characters.")
         return name
     
+    def validate_pool(self, pool):
+        # A running server stays on its device, so it cannot move to another pool
+        instance: Server = self.instance
+        if instance and pool != instance.pool and instance.status == ServerStatus.RUNNING:
+            raise serializers.ValidationError("Stop the server before moving it to another pool.")
+        return pool
+
     def validate_status(self, new_status):
         # Validates the requested status transition against allowed transitions defined in ServerStatus model
 
@@ -75,21 +148,23 @@ class ServerSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 f"Invalid transition {instance.status} -> {requested}"
             )
+        previous = instance.status
+        reason = ""
+        placement_ms = None
         # Special logic for “starting” (device assignment)
         if requested == ServerStatus.STARTING:
-            device = (
-                Device.objects
-                .filter(is_online=True)
-                .select_for_update(skip_locked=True)
-                .order_by("last_seen")
-                .first()
-            )
+            pool = validated_data.get("pool", instance.pool)
+            started = time.perf_counter()
+            device = select_device(pool)
+            placement_ms = (time.perf_counter() - started) * 1000
             if device:
                 validated_data["device"] = device
                 validated_data["status"] = ServerStatus.RUNNING
             else:
                 validated_data["device"] = None
                 validated_data["status"] = ServerStatus.ERROR
+                fallbacks = " or its fallback pools" if len(pool_order(pool)) > 1 else ""
+                reason = f"No online device in pool '{pool}'{fallbacks}."
 
         # running -> stopped -> clear device
         elif requested == ServerStatus.STOPPED:
@@ -98,4 +173,14 @@ class ServerSerializer(serializers.ModelSerializer):
         else:
             validated_data.setdefault("status", instance.status)
 
-        return super().update(instance, validated_data)
\ No newline at end of file
+        server = super().update(instance, validated_data)
+        if server.status != previous or requested == ServerStatus.STARTING:
+            record_transition(
+                server=server,
+                from_status=previous,
+                to_status=server.status,
+                device=server.device,
+                reason=reason,
+                placement_ms=placement_ms,
+            )
+        return server
\ No newline at end of file
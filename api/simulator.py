@@ -0,0 +1,167 @@
+import heapq
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from api.models import DEFAULT_POOL, ServerStatus
+from api.placement import choose_device
+
+EVENT_TYPES = ('create', 'start', 'stop', 'join', 'heartbeat', 'fail')
+
+# Event mix for synthetic traces, as (event, weight)
+SYNTHETIC_MIX = (
+    ('create', 10),
+    ('start', 35),
+    ('stop', 30),
+    ('heartbeat', 23),
+    ('fail', 1),
+    ('join', 1),
+)
+
+
+class Simulation:
+    '''
+    Replays server and device events against the placement policy in memory.
+    Starts go through api.placement.choose_device, the same policy ServerSerializer.update
+    uses, with an in-memory index standing in for the database query.
+
+    Events are dicts with an "event" key from EVENT_TYPES, a "server" or "device" id,
+    an optional "pool" (create and join) and an optional time "t" used as last_seen.
+    '''
+    def __init__(self):
+        self.servers = {} # id -> [status, pool, device]
+        self.devices = {} # id -> [pool, is_online, last_seen]
+        self.running = defaultdict(int) # device id -> running servers
+        self.online = defaultdict(list) # pool -> heap of (last_seen, device id), may hold stale entries
+        self.transitions = ServerStatus.transitions()
+        self.events = 0
+        self.starts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+
+    def first_online(self, pool):
+        # Least recently seen online device in pool, the in-memory version of the placement query
+        heap = self.online[pool]
+        while heap:
+            last_seen, device = heap[0]
+            state = self.devices[device]
+            if state[1] and state[2] == last_seen and state[0] == pool:
+                return device
+            heapq.heappop(heap)
+        return None
+
+    def _seen(self, device, now):
+        state = self.devices[device]
+        state[2] = now
+        if state[1]:
+            heapq.heappush(self.online[state[0]], (now, device))
+
+    def apply(self, event, now):
+        kind = event['event']
+        if kind == 'start':
+            server = self.servers.get(event['server'])
+            if server is None or ServerStatus.STARTING not in self.transitions[server[0]]:
+                self.rejected += 1
+                return
+            self.starts += 1
+            device = choose_device(server[1], self.first_online)
+            if device is None:
+                server[0], server[2] = ServerStatus.ERROR, None
+                self.errors += 1
+            else:
+                server[0], server[2] = ServerStatus.RUNNING, device
+                self.running[device] += 1
+        elif kind == 'stop':
+            server = self.servers.get(event['server'])
+            if server is None or server[0] != ServerStatus.RUNNING:
+                self.rejected += 1
+                return
+            self.running[server[2]] -= 1
+            server[0], server[2] = ServerStatus.STOPPED, None
+        elif kind == 'create':
+            if event['server'] in self.servers:
+                self.rejected += 1
+                return
+            self.servers[event['server']] = [ServerStatus.STOPPED, event.get('pool') or DEFAULT_POOL, None]
+        elif kind == 'heartbeat':
+            if event['device'] not in self.devices:
+                self.rejected += 1
+                return
+            self._seen(event['device'], now)
+        elif kind == 'join':
+            device = event['device']
+            pool = event.get('pool') or self.devices.get(device, [DEFAULT_POOL])[0]
+            self.devices[device] = [pool, True, now]
+            heapq.heappush(self.online[pool], (now, device))
+        elif kind == 'fail':
+            if event['device'] not in self.devices:
+                self.rejected += 1
+                return
+            # Like the API, taking a device offline leaves its running servers alone
+            self.devices[event['device']][1] = False
+        else:
+            self.rejected += 1
+
+    def run(self, events):
+        started = time.perf_counter()
+        for event in events:
+            self.events += 1
+            self.apply(event, event.get('t', self.events))
+        self.elapsed += time.perf_counter() - started
+        return self
+
+    def report(self):
+        loads = [self.running[device] for device, state in self.devices.items() if state[1]]
+        return {
+            'events': self.events,
+            'seconds': self.elapsed,
+            'events_per_second': self.events / self.elapsed if self.elapsed else 0.0,
+            'decisions': self.starts,
+            'decisions_per_second': self.starts / self.elapsed if self.elapsed else 0.0,
+            'errors': self.errors,
+            'error_rate': self.errors / self.starts if self.starts else 0.0,
+            'rejected': self.rejected,
+            'online_devices': len(loads),
+            'running_servers': sum(self.running.values()),
+            'load_min': min(loads, default=0),
+            'load_mean': statistics.fmean(loads) if loads else 0.0,
+            'load_max': max(loads, default=0),
+            'load_stdev': statistics.pstdev(loads) if loads else 0.0,
+        }
+
+
+def read_trace(path):
+    '''
+    Streams events from a JSON Lines trace file
+    '''
+    with open(path, encoding='utf-8') as f:
+        for text in f:
+            if text.strip():
+                yield json.loads(text)
+
+
+def synthetic_trace(events, devices=100, pools=1, seed=0):
+    '''
+    Generates a random trace: devices join first, then events are drawn from SYNTHETIC_MIX.
+    Stops and starts pick random servers, so some are rejected as invalid transitions.
+    '''
+    rng = random.Random(seed)
+    pool_names = [DEFAULT_POOL] if pools == 1 else [f"pool-{i}" for i in range(pools)]
+    kinds, weights = zip(*SYNTHETIC_MIX)
+    device_count = devices
+    server_count = 0
+    for device in range(1, devices + 1):
+        yield {'event': 'join', 'device': device, 'pool': pool_names[device % pools], 't': 0}
+    for t, kind in enumerate(rng.choices(kinds, weights, k=events), 1):
+        if kind == 'create' or (server_count == 0 and kind in ('start', 'stop')):
+            server_count += 1
+            yield {'event': 'create', 'server': server_count, 'pool': rng.choice(pool_names), 't': t}
+        elif kind in ('start', 'stop'):
+            yield {'event': kind, 'server': rng.randint(1, server_count), 't': t}
+        elif kind == 'join' and rng.random() < 0.5:
+            device_count += 1
+            yield {'event': 'join', 'device': device_count, 'pool': rng.choice(pool_names), 't': t}
+        else:
+            yield {'event': kind, 'device': rng.randint(1, device_count), 't': t}
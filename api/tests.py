@@ -1,11 +1,27 @@
-from django.test import TestCase
-from django.urls import reverse
+import importlib
+import tempfile
+from pathlib import Path
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import Resolver404, clear_url_caches, resolve, reverse
 from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.test import APIClient
-from api.models import Device, Server, ServerStatus
+from api import history, representation_cache
+from api.rebalance import apply_moves, Move, plan_moves, plan_server_moves
+from api.serializers import ServerSerializer
+from api.simulator import Simulation
+from api.models import Device, IdempotencyKey, Server, ServerStatus, ServerTransition
+from servermanager.schema import _read_schema, prebuilt_schema_view
 
 class BaseAPITestCase(TestCase):
     '''
@@ -14,6 +30,7 @@ class BaseAPITestCase(TestCase):
     def setUp(self):
         super().setUp()
         self.client = APIClient()
+        representation_cache.clear()
 
 
 class DeviceRequestsTests(BaseAPITestCase):
@@ -325,6 +342,290 @@ class ServerTransitionTests(BaseAPITestCase):
         self.assertEqual(response_b.status_code, status.HTTP_200_OK)
         self.assertEqual(response_b.json()["device"], self.online_device.id)
 
+class PoolPlacementTests(BaseAPITestCase):
+    '''
+    Tests for placing servers only on devices in their pool
+    '''
+    def start(self, server):
+        return self.client.patch(
+            reverse("server-detail", args=[server.id]),
+            {"status": ServerStatus.STARTING},
+            format="json",
+        ).json()
+
+    def test_server_is_placed_in_its_own_pool(self):
+        ### Ensure a server never lands on a device from another pool ###
+        Device.objects.create(name="West-Node", pool="west")
+        east = Device.objects.create(name="East-Node", pool="east")
+        body = self.start(Server.objects.create(name="EastServer", pool="east"))
+        self.assertEqual(body["status"], ServerStatus.RUNNING)
+        self.assertEqual(body["device"], east.id)
+
+    def test_empty_pool_without_fallback_errors(self):
+        ### Ensure a pool with no online device fails the start even if other pools have capacity ###
+        Device.objects.create(name="West-Node", pool="west")
+        body = self.start(Server.objects.create(name="EastServer", pool="east"))
+        self.assertEqual(body["status"], ServerStatus.ERROR)
+        self.assertIsNone(body["device"])
+
+    def test_empty_pool_uses_fallback_pools_in_order(self):
+        ### Ensure the configured fallback pools are tried in order ###
+        Device.objects.create(name="South-Node", pool="south")
+        west = Device.objects.create(name="West-Node", pool="west")
+        with self.settings(POOL_FALLBACKS={"east": ["west", "south"]}):
+            body = self.start(Server.objects.create(name="EastServer", pool="east"))
+        self.assertEqual(body["status"], ServerStatus.RUNNING)
+        self.assertEqual(body["device"], west.id)
+
+    def test_running_server_cannot_change_pool(self):
+        ### Ensure a running server must be stopped before it moves pools ###
+        device = Device.objects.create(name="Node")
+        server = Server.objects.create(name="Pinned", status=ServerStatus.RUNNING, device=device)
+        response = self.client.patch(
+            reverse("server-detail", args=[server.id]),
+            {"pool": "east"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_device_with_running_servers_cannot_change_pool(self):
+        ### Ensure a device keeps its pool while it hosts running servers ###
+        device = Device.objects.create(name="Host")
+        server = Server.objects.create(name="Hosted", status=ServerStatus.RUNNING, device=device)
+        url = reverse("device-detail", args=[device.id])
+        response = self.client.patch(url, {"pool": "east"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        Server.objects.filter(pk=server.pk).update(status=ServerStatus.STOPPED, device=None)
+        self.assertEqual(self.client.patch(url, {"pool": "east"}, format="json").status_code, status.HTTP_200_OK)
+
+
+class TransitionHistoryTests(BaseAPITestCase):
+    '''
+    Tests for the buffered server transition log and the history endpoint
+    '''
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(history.flush)
+
+    def start(self, server):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("server-detail", args=[server.id]),
+                {"status": ServerStatus.STARTING},
+                format="json",
+            )
+
+    def test_transitions_are_buffered_until_flushed(self):
+        ### Ensure transitions are queued after commit and written in one batch ###
+        device = Device.objects.create(name="Node")
+        server = Server.objects.create(name="Logged")
+        self.start(server)
+        self.assertFalse(ServerTransition.objects.exists())
+        history.flush()
+        event = ServerTransition.objects.get()
+        self.assertEqual((event.from_status, event.to_status), (ServerStatus.STOPPED, ServerStatus.RUNNING))
+        self.assertEqual(event.device, device)
+        self.assertIsNotNone(event.placement_ms)
+
+    @override_settings(TRANSITION_LOG_BATCH_SIZE=1)
+    def test_failed_write_is_logged_not_raised(self):
+        ### Ensure a log write failing after commit neither fails the request nor drops events silently ###
+        Device.objects.create(name="Node")
+        server = Server.objects.create(name="Unlogged")
+        with mock.patch.object(ServerTransition.objects, "bulk_create", side_effect=DatabaseError("down")):
+            with self.assertLogs("api.history", "ERROR") as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.patch(
+                        reverse("server-detail", args=[server.id]),
+                        {"status": ServerStatus.STARTING},
+                        format="json",
+                    )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(f"server={server.id} stopped -> running", "\n".join(logs.output))
+
+    @override_settings(TRANSITION_LOG_BATCH_SIZE=2)
+    def test_full_batch_is_written_immediately(self):
+        ### Ensure the buffer is written as soon as it reaches the batch size ###
+        Device.objects.create(name="Node")
+        self.start(Server.objects.create(name="First"))
+        self.assertEqual(ServerTransition.objects.count(), 0)
+        self.start(Server.objects.create(name="Second"))
+        self.assertEqual(ServerTransition.objects.count(), 2)
+
+    def test_failed_placement_records_reason(self):
+        ### Ensure a start with no capacity logs why it failed ###
+        server = Server.objects.create(name="Unlucky", pool="east")
+        self.start(server)
+        history.flush()
+        event = ServerTransition.objects.get()
+        self.assertEqual(event.to_status, ServerStatus.ERROR)
+        self.assertIn("east", event.reason)
+
+    def test_history_endpoint_is_paginated_newest_first(self):
+        ### Ensure the history endpoint pages through events newest first ###
+        server = Server.objects.create(name="Busy")
+        now = timezone.now()
+        ServerTransition.objects.bulk_create(
+            ServerTransition(
+                server=server,
+                from_status=ServerStatus.STOPPED,
+                to_status=ServerStatus.ERROR,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(3)
+        )
+        url = reverse("server-history", args=[server.id])
+        first = self.client.get(url, {"page_size": 2}).json()
+        self.assertEqual(len(first["results"]), 2)
+        self.assertGreater(first["results"][0]["created_at"], first["results"][1]["created_at"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next"])
+
+    def test_prune_deletes_old_transitions(self):
+        ### Ensure events past the retention period are pruned ###
+        server = Server.objects.create(name="Old")
+        for age in (1, 40):
+            ServerTransition.objects.create(
+                server=server,
+                from_status=ServerStatus.STOPPED,
+                to_status=ServerStatus.ERROR,
+                created_at=timezone.now() - timedelta(days=age),
+            )
+        call_command("prune_transitions", days=30, stdout=StringIO())
+        self.assertEqual(ServerTransition.objects.count(), 1)
+
+
+class RebalanceTests(TestCase):
+    '''
+    Tests for planning and applying server moves between devices
+    '''
+    def run_servers(self, device, count):
+        for i in range(count):
+            Server.objects.create(name=f"{device.name}-{i}", status=ServerStatus.RUNNING, device=device)
+
+    def rebalance(self, **options):
+        out = StringIO()
+        call_command("rebalance_servers", stdout=out, **options)
+        return out.getvalue()
+
+    def test_plan_moves_reaches_tolerance_with_fewest_moves(self):
+        ### Ensure the plan only moves servers from overloaded to underloaded devices ###
+        moves = plan_moves({1: 6, 2: 0, 3: 3}, tolerance=1)
+        self.assertEqual(len(moves), 3)
+        self.assertTrue(all(source == 1 for source, _ in moves))
+        self.assertEqual(plan_moves({1: 3, 2: 2}, tolerance=1), [])
+
+    def test_plan_moves_respects_max_moves(self):
+        ### Ensure a cycle never plans more than max_moves ###
+        self.assertEqual(len(plan_moves({1: 100, 2: 0}, tolerance=1, max_moves=5)), 5)
+
+    def test_rebalance_moves_servers_to_empty_device(self):
+        ### Ensure a device that comes back online empty picks up load ###
+        busy = Device.objects.create(name="busy")
+        empty = Device.objects.create(name="empty")
+        self.run_servers(busy, 6)
+        self.rebalance()
+        self.assertEqual(Server.objects.filter(device=busy).count(), 3)
+        self.assertEqual(Server.objects.filter(device=empty).count(), 3)
+
+    def test_rebalance_dry_run_changes_nothing(self):
+        ### Ensure dry run prints the plan without moving servers ###
+        busy = Device.objects.create(name="busy")
+        Device.objects.create(name="empty")
+        self.run_servers(busy, 4)
+        output = self.rebalance(dry_run=True)
+        self.assertIn("Planned 2 moves", output)
+        self.assertEqual(Server.objects.filter(device=busy).count(), 4)
+
+    def test_rebalance_stays_within_pool_and_skips_offline_devices(self):
+        ### Ensure servers only move to online devices in their own pool ###
+        busy = Device.objects.create(name="busy", pool="east")
+        Device.objects.create(name="west", pool="west")
+        Device.objects.create(name="offline", pool="east", is_online=False)
+        self.run_servers(busy, 4)
+        self.rebalance()
+        self.assertEqual(Server.objects.filter(device=busy).count(), 4)
+
+    def test_rebalance_caps_moves_per_cycle(self):
+        ### Ensure --max-moves limits how many servers move in one run ###
+        busy = Device.objects.create(name="busy")
+        empty = Device.objects.create(name="empty")
+        self.run_servers(busy, 10)
+        self.rebalance(max_moves=2, batch_size=1)
+        self.assertEqual(Server.objects.filter(device=empty).count(), 2)
+
+    def test_plan_only_targets_the_server_pool_and_fallbacks(self):
+        ### Ensure servers sitting on a device outside their pool are not spread further ###
+        busy = Device.objects.create(name="busy", pool="west")
+        Device.objects.create(name="empty", pool="west")
+        for i in range(4):
+            Server.objects.create(name=f"east-{i}", pool="east", status=ServerStatus.RUNNING, device=busy)
+        self.assertEqual(plan_server_moves(), [])
+        with override_settings(POOL_FALLBACKS={"east": ["west"]}):
+            self.assertEqual(len(plan_server_moves()), 2)
+
+    def test_apply_skips_targets_changed_since_planning(self):
+        ### Ensure servers are not moved onto a target that went offline or left the pool ###
+        busy = Device.objects.create(name="busy")
+        offline = Device.objects.create(name="offline")
+        moved_away = Device.objects.create(name="moved-away")
+        self.run_servers(busy, 8)
+        moves = plan_server_moves()
+        self.assertEqual({move.target for move in moves}, {offline.pk, moved_away.pk})
+        Device.objects.filter(pk=offline.pk).update(is_online=False)
+        Device.objects.filter(pk=moved_away.pk).update(pool="west")
+        self.assertEqual(apply_moves(moves), 0)
+        self.assertEqual(Server.objects.filter(device=busy).count(), 8)
+
+
+class PlacementSimulatorTests(TestCase):
+    '''
+    Tests for the in-memory placement simulator
+    '''
+    def test_simulator_places_on_least_recently_seen_device_in_pool(self):
+        ### Ensure the simulator follows the same policy as the API ###
+        simulation = Simulation().run([
+            {"event": "join", "device": 1, "pool": "east", "t": 5},
+            {"event": "join", "device": 2, "pool": "east", "t": 1},
+            {"event": "join", "device": 3, "pool": "west", "t": 0},
+            {"event": "heartbeat", "device": 2, "t": 9},
+            {"event": "create", "server": 1, "pool": "east"},
+            {"event": "start", "server": 1},
+        ])
+        self.assertEqual(simulation.servers[1][2], 1)
+        self.assertEqual(simulation.report()["error_rate"], 0)
+
+    def test_simulator_uses_fallback_pools_and_counts_errors(self):
+        ### Ensure empty pools fall back like the API and otherwise count as errors ###
+        events = [
+            {"event": "join", "device": 1, "pool": "west"},
+            {"event": "create", "server": 1, "pool": "east"},
+            {"event": "start", "server": 1},
+        ]
+        self.assertEqual(Simulation().run(events).report()["errors"], 1)
+        with self.settings(POOL_FALLBACKS={"east": ["west"]}):
+            simulation = Simulation().run(events)
+        self.assertEqual(simulation.servers[1][:2], [ServerStatus.RUNNING, "east"])
+
+    def test_simulator_rejects_invalid_transitions(self):
+        ### Ensure events the API would reject are counted, not applied ###
+        report = Simulation().run([
+            {"event": "create", "server": 1},
+            {"event": "stop", "server": 1},
+            {"event": "start", "server": 2},
+        ]).report()
+        self.assertEqual(report["rejected"], 2)
+        self.assertEqual(report["decisions"], 0)
+
+    def test_simulate_placement_command_reports(self):
+        ### Ensure the command runs a synthetic trace and prints the report ###
+        out = StringIO()
+        call_command("simulate_placement", events=2000, devices=10, pools=2, stdout=out)
+        self.assertIn("Placement decisions", out.getvalue())
+        self.assertIn("Running servers per online device", out.getvalue())
+
+
 class ServerBehaviorTests(BaseAPITestCase):
     '''
     Tests for automatic behaviors of the Server model
@@ -363,3 +664,454 @@ class ServerBehaviorTests(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         created_at = parse_datetime(response.json()["created_at"])
         self.assertAlmostEqual(timezone.now(), created_at, delta=timedelta(seconds=5))
+
+
+class BulkCreateTests(BaseAPITestCase):
+    '''
+    Tests for registering lists of devices and servers in one request
+    '''
+    def test_bulk_register_devices(self):
+        ### Ensure a list body creates every device and returns them in input order ###
+        response = self.client.post(
+            reverse("device-list"),
+            [{"name": f"Node-{i}"} for i in range(5)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([d["name"] for d in response.json()], [f"Node-{i}" for i in range(5)])
+        self.assertEqual(Device.objects.count(), 5)
+
+    def test_bulk_create_servers_allocates_unique_subdomains(self):
+        ### Ensure subdomains match single creates, including collisions inside the batch ###
+        self.client.post(reverse("server-list"), {"name": "Batch Server"}, format="json")
+        response = self.client.post(
+            reverse("server-list"),
+            [{"name": "Batch Server"}, {"name": "Other"}, {"name": "batch-server"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = response.json()
+        self.assertEqual([s["subdomain"] for s in body], ["batch-server-1", "other", "batch-server-2"])
+        self.assertTrue(all(s["status"] == ServerStatus.STOPPED for s in body))
+        self.assertEqual(Server.objects.count(), 4)
+
+    def test_bulk_create_rejects_whole_batch_on_invalid_item(self):
+        ### Ensure one invalid server fails the request without creating the others ###
+        response = self.client.post(
+            reverse("server-list"),
+            [{"name": "Valid"}, {"name": "a"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Server.objects.count(), 0)
+
+    @override_settings(BULK_CREATE_MAX_ITEMS=2)
+    def test_bulk_create_rejects_oversized_list(self):
+        ### Ensure a list above BULK_CREATE_MAX_ITEMS is refused and points at import_fleet ###
+        response = self.client.post(
+            reverse("server-list"),
+            [{"name": "One"}, {"name": "Two"}, {"name": "Three"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("import_fleet", str(response.json()))
+        self.assertEqual(Server.objects.count(), 0)
+
+    def test_allocate_subdomains_uses_one_query(self):
+        ### Ensure batch subdomain allocation checks collisions with a single query ###
+        Server.objects.create(name="Taken")
+        with self.assertNumQueries(1):
+            subdomains = Server.allocate_subdomains(["Taken", "Taken", "Fresh"])
+        self.assertEqual(subdomains, ["taken-1", "taken-2", "fresh"])
+
+    def test_punctuation_only_names_do_not_match_every_subdomain(self):
+        ### Ensure a name with an empty base gets a fallback subdomain instead of scanning the table ###
+        Server.objects.create(name="Unrelated")
+        response = self.client.post(reverse("server-list"), [{"name": "!!!"}, {"name": "???"}], format="json")
+        self.assertEqual([s["subdomain"] for s in response.json()], ["server", "server-1"])
+        single = self.client.post(reverse("server-list"), {"name": "***"}, format="json").json()
+        self.assertEqual(single["subdomain"], "server-2")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Server.allocate_subdomains(["%%%"]), ["server-3"])
+        # Case-sensitive prefix matches, which the subdomain LIKE index can serve
+        self.assertNotIn("UPPER", queries[0]["sql"])
+
+
+class ImportFleetTests(TestCase):
+    '''
+    Tests for the import_fleet management command
+    '''
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.devices = Path(self.tmp.name) / "devices.csv"
+        self.devices.write_text("name,pool,is_online\nEdge-1,east,true\nEdge-2,,false\nEdge-1,west,true\n")
+        self.servers = Path(self.tmp.name) / "servers.jsonl"
+        self.servers.write_text(
+            '{"name": "Web", "pool": "east", "status": "running", "device": "Edge-1"}\n'
+            '{"name": "Web"}\n'
+            '{"name": "Web 1"}\n'
+            '{"name": "Api", "status": "stopped", "device": ""}\n'
+        )
+
+    def import_fleet(self):
+        call_command(
+            "import_fleet",
+            devices=str(self.devices),
+            servers=str(self.servers),
+            stdout=StringIO(),
+        )
+
+    def assert_fleet_imported(self):
+        self.assertEqual(sorted(Device.objects.values_list("name", flat=True)), ["Edge-1", "Edge-2", "Existing"])
+        servers = list(Server.objects.order_by("id"))
+        self.assertEqual([s.name for s in servers], ["Taken", "Web", "Web", "Web 1", "Api"])
+        subdomains = [s.subdomain for s in servers]
+        self.assertEqual(len(set(subdomains)), len(subdomains))
+        self.assertEqual(subdomains[1:4], ["web-1", "web-2", "web-1-1"])
+        self.assertEqual(servers[1].device.name, "Edge-1")
+        self.assertEqual(servers[1].device.pool, "east")
+        self.assertEqual(servers[1].pool, "east")
+        self.assertEqual(servers[2].pool, "default")
+        self.assertEqual(servers[1].status, ServerStatus.RUNNING)
+        self.assertIsNone(servers[4].device)
+
+    def test_import_fleet_loads_devices_and_servers(self):
+        ### Ensure the COPY path skips known devices, resolves device names and avoids subdomain collisions ###
+        Device.objects.create(name="Existing")
+        Server.objects.filter(pk=Server.objects.create(name="Taken").pk).update(subdomain="web")
+        self.import_fleet()
+        self.assert_fleet_imported()
+
+    def test_import_fleet_falls_back_to_bulk_create(self):
+        ### Ensure databases without COPY get the same result through the ORM ###
+        Device.objects.create(name="Existing")
+        Server.objects.filter(pk=Server.objects.create(name="Taken").pk).update(subdomain="web")
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            self.import_fleet()
+        self.assert_fleet_imported()
+
+    def test_import_fleet_rejects_unknown_device(self):
+        ### Ensure an unresolved device reference rolls back the whole import ###
+        self.servers.write_text('{"name": "Lost", "device": "Nowhere"}\n')
+        with self.assertRaises(CommandError):
+            self.import_fleet()
+        self.assertFalse(Device.objects.exists())
+        self.assertFalse(Server.objects.exists())
+
+    def test_import_fleet_numbers_past_existing_subdomains(self):
+        ### Ensure existing suffixes of any length never abort the import or collide ###
+        for subdomain in ("web", "web-7", "web-99999999999999999999", "web-1-1"):
+            Server.objects.filter(pk=Server.objects.create(name="Taken").pk).update(subdomain=subdomain)
+        self.servers.write_text('{"name": "Web"}\n{"name": "Web 1"}\n')
+        for vendor in ("postgresql", "sqlite"):
+            with self.subTest(vendor=vendor), transaction.atomic():
+                with mock.patch.object(connection, "vendor", vendor):
+                    self.import_fleet()
+                imported = list(Server.objects.filter(name__startswith="Web").order_by("id").values_list("subdomain", flat=True))
+                self.assertEqual(len(set(imported)), 2)
+                self.assertNotIn(imported[0], ("web", "web-7"))
+                transaction.set_rollback(True)
+
+    def test_import_fleet_rejects_status_device_mismatch(self):
+        ### Ensure only running servers have a device and starting servers are refused ###
+        for row in (
+            '{"name": "Idle", "status": "running"}',
+            '{"name": "Idle", "status": "stopped", "device": "Edge-1"}',
+            '{"name": "Idle", "status": "error", "device": "Edge-1"}',
+            '{"name": "Idle", "status": "starting"}',
+        ):
+            self.servers.write_text(row + "\n")
+            with self.subTest(row=row), self.assertRaisesMessage(CommandError, "servers.jsonl:1:"):
+                self.import_fleet()
+        self.assertFalse(Server.objects.exists())
+
+    def test_import_fleet_rejects_device_outside_pool(self):
+        ### Ensure both paths refuse servers placed on a device outside their pool and its fallbacks ###
+        self.servers.write_text('{"name": "Stray", "pool": "west", "status": "running", "device": "Edge-1"}\n')
+        for vendor in ("postgresql", "sqlite"):
+            with mock.patch.object(connection, "vendor", vendor):
+                with self.assertRaisesMessage(CommandError, "not in pool 'west'"):
+                    self.import_fleet()
+        self.assertFalse(Server.objects.exists())
+        with override_settings(POOL_FALLBACKS={"west": ["east"]}):
+            self.import_fleet()
+        self.assertEqual(Server.objects.get().device.pool, "east")
+
+    def test_import_fleet_reports_progress_across_batches(self):
+        ### Ensure progress is reported when a batch passes a multiple of --progress-every ###
+        self.servers.write_text("".join(f'{{"name": "Server {i}"}}\n' for i in range(1200)))
+        out = StringIO()
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            call_command("import_fleet", servers=str(self.servers), progress_every=300, stdout=out)
+        self.assertIn("500 servers imported", out.getvalue())
+        self.assertIn("1000 servers imported", out.getvalue())
+
+
+class IdempotencyKeyTests(BaseAPITestCase):
+    '''
+    Tests for replaying server creates and transitions sent with an Idempotency-Key
+    '''
+    def test_retried_create_does_not_duplicate_server(self):
+        ### Ensure a retried POST with the same key returns the first server ###
+        first = self.client.post(
+            reverse("server-list"),
+            {"name": "Retry Me"},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="create-1",
+        )
+        second = self.client.post(
+            reverse("server-list"),
+            {"name": "Retry Me"},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="create-1",
+        )
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Server.objects.count(), 1)
+
+    def test_retried_start_does_not_run_placement_again(self):
+        ### Ensure a retried start PATCH replays the original placement ###
+        first_device = Device.objects.create(name="First", is_online=True)
+        server = Server.objects.create(name="Placed")
+        url = reverse("server-detail", args=[server.id])
+        self.client.patch(url, {"status": ServerStatus.STARTING}, format="json", HTTP_IDEMPOTENCY_KEY="start-1")
+        # Taking the device offline would send a fresh start to error
+        first_device.is_online = False
+        first_device.save()
+        response = self.client.patch(url, {"status": ServerStatus.STARTING}, format="json", HTTP_IDEMPOTENCY_KEY="start-1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"], ServerStatus.RUNNING)
+        self.assertEqual(response.json()["device"], first_device.id)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        ### Ensure a key cannot be reused for a different request ###
+        self.client.post(reverse("server-list"), {"name": "One"}, format="json", HTTP_IDEMPOTENCY_KEY="dup")
+        response = self.client.post(reverse("server-list"), {"name": "Two"}, format="json", HTTP_IDEMPOTENCY_KEY="dup")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Server.objects.count(), 1)
+
+    def test_failed_request_releases_key(self):
+        ### Ensure a request rejected by validation can be retried with the same key ###
+        bad = self.client.post(reverse("server-list"), {"name": "a"}, format="json", HTTP_IDEMPOTENCY_KEY="fix-me")
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_killed_request_releases_key(self):
+        ### Ensure a worker killed mid-request leaves no pending key behind ###
+        # Gunicorn's sync workers exit with SystemExit when they hit the timeout
+        with mock.patch("api.serializers.ServerSerializer.create", side_effect=SystemExit(1)):
+            with self.assertRaises(SystemExit):
+                self.client.post(reverse("server-list"), {"name": "Killed"}, format="json", HTTP_IDEMPOTENCY_KEY="kill")
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.client.post(reverse("server-list"), {"name": "Killed"}, format="json", HTTP_IDEMPOTENCY_KEY="kill")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_expired_key_is_processed_again(self):
+        ### Ensure an expired key no longer replays and is replaced ###
+        self.client.post(reverse("server-list"), {"name": "Old"}, format="json", HTTP_IDEMPOTENCY_KEY="old")
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(reverse("server-list"), {"name": "Old"}, format="json", HTTP_IDEMPOTENCY_KEY="old")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(Server.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_prune_deletes_only_expired_keys(self):
+        ### Ensure the prune command removes expired keys and keeps live ones ###
+        now = timezone.now()
+        IdempotencyKey.objects.create(client="ip:1", key="live", fingerprint="x", expires_at=now + timedelta(hours=1))
+        IdempotencyKey.objects.create(client="ip:1", key="dead", fingerprint="x", expires_at=now - timedelta(hours=1))
+        call_command("prune_idempotency_keys", stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["live"])
+
+
+class RepresentationCacheTests(BaseAPITestCase):
+    '''
+    Tests for serving device and server representations from pre-rendered fragments
+    '''
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(name="Cached-Node")
+        self.servers = [Server.objects.create(name=f"cached-{i}") for i in range(3)]
+
+    def test_cached_list_matches_serialized_list(self):
+        ### Ensure a list assembled from fragments is byte for byte the normal response ###
+        with override_settings(REPRESENTATION_CACHE_SIZE=0):
+            expected = self.client.get(reverse("server-list")).content
+        first = self.client.get(reverse("server-list"))
+        second = self.client.get(reverse("server-list"))
+        self.assertEqual(first.content, expected)
+        self.assertEqual(second.content, expected)
+        self.assertEqual(second["Content-Type"], "application/json")
+        stats = representation_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 3))
+        self.assertEqual(stats["bytes_saved"], len(expected) - 2 - 2) # less brackets and commas
+
+    def test_only_misses_are_serialized(self):
+        ### Ensure a warm list only serializes rows it has no fragment for ###
+        self.client.get(reverse("server-list"))
+        Server.objects.create(name="cached-new")
+        with mock.patch("api.serializers.ServerSerializer.to_representation", autospec=True,
+                        side_effect=ServerSerializer.to_representation) as to_representation:
+            servers = self.client.get(reverse("server-list")).json()
+        self.assertEqual(len(servers), 4)
+        self.assertEqual(to_representation.call_count, 1)
+        self.assertEqual(representation_cache.stats()["misses"], 4)
+
+    def test_retrieve_uses_cache(self):
+        ### Ensure retrieve serves the fragment and still returns 404 for unknown ids ###
+        url = reverse("server-detail", args=[self.servers[0].id])
+        expected = self.client.get(url).content
+        self.assertEqual(self.client.get(url).content, expected)
+        self.assertEqual(representation_cache.stats()["hits"], 1)
+        response = self.client.get(reverse("server-detail", args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_save_and_transition_invalidate(self):
+        ### Ensure PATCHes and status transitions are visible on the next read ###
+        self.client.get(reverse("device-list"))
+        self.client.get(reverse("server-list"))
+        self.client.patch(reverse("device-detail", args=[self.device.id]), {"is_online": False}, format="json")
+        self.assertFalse(self.client.get(reverse("device-list")).json()[0]["is_online"])
+        self.client.patch(reverse("device-detail", args=[self.device.id]), {"is_online": True}, format="json")
+        server = self.servers[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse("server-detail", args=[server.id]), {"status": ServerStatus.STARTING}, format="json")
+        state = self.client.get(reverse("server-detail", args=[server.id])).json()
+        self.assertEqual((state["status"], state["device"]), (ServerStatus.RUNNING, self.device.id))
+        history.flush()
+
+    def test_stale_fragment_from_other_process_is_not_served(self):
+        ### Ensure a fragment is only served for the version it was rendered at ###
+        self.client.get(reverse("server-list"))
+        # Another process saving the row bumps version without touching this process's cache
+        Server.objects.filter(pk=self.servers[0].pk).update(name="renamed", version=F("version") + 1)
+        self.assertEqual(self.client.get(reverse("server-list")).json()[0]["name"], "renamed")
+
+    def test_racing_saves_get_distinct_versions(self):
+        ### Ensure two saves from stale copies of a row never share a version ###
+        first = Device.objects.get(pk=self.device.pk)
+        second = Device.objects.get(pk=self.device.pk)
+        first.name = "First"
+        first.save()
+        self.assertEqual(first.version, 2)
+        self.client.get(reverse("device-list"))
+        # Saved by another worker, so this process's cache is not invalidated
+        second.is_online = False
+        with mock.patch("api.representation_cache.invalidate"):
+            second.save()
+        self.assertEqual(second.version, 3)
+        self.assertFalse(self.client.get(reverse("device-list")).json()[0]["is_online"])
+
+    def test_rebalance_bumps_version(self):
+        ### Ensure servers moved by the rebalancer are re-rendered ###
+        other = Device.objects.create(name="Other-Node")
+        Server.objects.filter(pk=self.servers[0].pk).update(status=ServerStatus.RUNNING, device=self.device)
+        self.client.get(reverse("server-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_moves([Move(self.servers[0].pk, self.device.pk, other.pk)])
+        history.flush()
+        self.assertEqual(self.client.get(reverse("server-list")).json()[0]["device"], other.pk)
+
+    def test_device_delete_bumps_server_versions(self):
+        ### Ensure servers detached by deleting their device are re-rendered ###
+        Server.objects.filter(pk=self.servers[0].pk).update(status=ServerStatus.RUNNING, device=self.device)
+        self.client.get(reverse("server-list"))
+        # Deleted by another worker, so this process's cache is not invalidated
+        with mock.patch("api.representation_cache.invalidate"):
+            self.device.delete()
+        self.assertIsNone(self.client.get(reverse("server-list")).json()[0]["device"])
+
+    @override_settings(REPRESENTATION_CACHE_SIZE=2)
+    def test_lru_is_bounded(self):
+        ### Ensure the in-process cache keeps only the most recently used rows ###
+        self.client.get(reverse("server-list"))
+        self.assertEqual(representation_cache.stats()["entries"], 2)
+
+    @override_settings(
+        REPRESENTATION_CACHE_SIZE=0,
+        REPRESENTATION_CACHE_ALIAS="representations",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "representations": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"},
+        },
+    )
+    def test_shared_backend(self):
+        ### Ensure fragments are shared through the configured cache alias ###
+        expected = self.client.get(reverse("device-list")).content
+        self.assertEqual(self.client.get(reverse("device-list")).content, expected)
+        self.assertEqual(representation_cache.stats()["hits"], 1)
+        self.client.patch(reverse("device-detail", args=[self.device.id]), {"name": "Renamed"}, format="json")
+        self.assertEqual(self.client.get(reverse("device-list")).json()[0]["name"], "Renamed")
+
+    def test_browsable_and_indented_json_bypass_cache(self):
+        ### Ensure other renderings are not assembled from compact fragments ###
+        response = self.client.get(reverse("server-list"), HTTP_ACCEPT="application/json; indent=2")
+        self.assertIn(b"\n", response.content)
+        self.assertEqual(representation_cache.stats()["misses"], 0)
+
+    def test_format_suffix_bypasses_cache(self):
+        ### Ensure detail_url rendered for a .json request is never served to plain requests ###
+        with override_settings(REPRESENTATION_CACHE_SIZE=0):
+            expected = self.client.get(reverse("server-list")).content
+        suffixed = self.client.get(reverse("server-list", kwargs={"format": "json"})).json()
+        self.assertTrue(suffixed[0]["detail_url"].endswith(".json"))
+        self.assertEqual(self.client.get(reverse("server-list")).content, expected)
+
+    def test_stats_endpoint(self):
+        ### Ensure hit rate and bytes saved are reported ###
+        self.client.get(reverse("device-list"))
+        self.client.get(reverse("device-list"))
+        stats = self.client.get(reverse("representation-cache-stats")).json()
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertGreater(stats["bytes_saved"], 0)
+
+
+class PrebuiltSchemaTests(TestCase):
+    '''
+    Tests for serving the OpenAPI schema generated at build time
+    '''
+    def test_prebuilt_schema_is_served_from_file(self):
+        ### Ensure the schema view returns the file contents without regenerating it ###
+        with tempfile.TemporaryDirectory() as tmp:
+            schema_file = Path(tmp) / "openapi-schema.yml"
+            schema_file.write_text("openapi: 3.0.3\n")
+            _read_schema.cache_clear()
+            with override_settings(OPENAPI_SCHEMA_FILE=schema_file):
+                response = prebuilt_schema_view(RequestFactory().get("/api/schema/"))
+            _read_schema.cache_clear()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"openapi: 3.0.3\n")
+        self.assertTrue(response["Content-Type"].startswith("application/vnd.oai.openapi"))
+
+    @skipUnless(apps.is_installed("drf_spectacular"), "API docs are disabled")
+    def test_schema_generates_without_warnings(self):
+        ### Ensure the build-time schema step reports no errors or warnings ###
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command("spectacular", "--fail-on-warn", file=str(Path(tmp) / "schema.yml"), stderr=StringIO())
+
+    def schema_view(self, **settings):
+        # Rebuilds the root urlconf under settings, then restores it
+        import servermanager.urls
+        try:
+            with override_settings(**settings):
+                importlib.reload(servermanager.urls)
+                clear_url_caches()
+                try:
+                    return resolve("/api/schema/").func
+                except Resolver404:
+                    return None
+        finally:
+            importlib.reload(servermanager.urls)
+            clear_url_caches()
+
+    def test_prebuilt_schema_only_served_when_enabled(self):
+        ### Ensure an existing schema file is ignored unless SERVE_PREBUILT_SCHEMA is on ###
+        with tempfile.TemporaryDirectory() as tmp:
+            schema_file = Path(tmp) / "openapi-schema.yml"
+            schema_file.write_text("openapi: 3.0.3\n")
+            self.assertIsNot(self.schema_view(OPENAPI_SCHEMA_FILE=schema_file, SERVE_PREBUILT_SCHEMA=False), prebuilt_schema_view)
+            self.assertIs(self.schema_view(OPENAPI_SCHEMA_FILE=schema_file, SERVE_PREBUILT_SCHEMA=True), prebuilt_schema_view)
@@ -1,8 +1,11 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import DeviceViewSet, ServerViewSet
+from .views import DeviceViewSet, RepresentationCacheStatsView, ServerViewSet
 
 router = DefaultRouter()
 router.register(r'devices', DeviceViewSet, basename='device')
 router.register(r'servers', ServerViewSet, basename='server')
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('cache-stats/', RepresentationCacheStatsView.as_view(), name='representation-cache-stats'),
+]
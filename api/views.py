@@ -1,11 +1,109 @@
-from rest_framework import viewsets
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import generics, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import AllowAny
-from api.serializers import DeviceSerializer, ServerSerializer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from api import representation_cache
+from api.serializers import (
+    DeviceSerializer,
+    RepresentationCacheStatsSerializer,
+    ServerSerializer,
+    ServerTransitionSerializer,
+)
+from api.idempotency import IdempotencyKeyMixin
 from api.models import Device, Server
 
-class DeviceViewSet(viewsets.ModelViewSet):
+if apps.is_installed('drf_spectacular'):
+    from drf_spectacular.utils import extend_schema
+else:
+    # Schema hints are only read by drf-spectacular, so skip importing it when the docs are off
+    def extend_schema(**kwargs):
+        return lambda view: view
+
+class TransitionPagination(CursorPagination):
+    # Cursor pagination walks the (server, -created_at) index and never counts the whole log
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class BulkCreateMixin:
+    '''
+    Lets POST accept a list of objects, validated with many=True and created in one batch.
+    Lists longer than BULK_CREATE_MAX_ITEMS are rejected before any item is validated.
+    '''
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'create' and isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+            kwargs['max_length'] = settings.BULK_CREATE_MAX_ITEMS
+        return super().get_serializer(*args, **kwargs)
+
+
+class CachedRepresentationMixin:
+    '''
+    Answers plain JSON list and retrieve requests from pre-rendered rows in
+    api.representation_cache. Only (id, version) is read for every row; rows with no
+    fragment at their current version are fetched, serialized and cached.
+    '''
+    def _cacheable(self, request):
+        # Browsable API and indented JSON go through the normal renderer, and so do
+        # format suffix URLs (/api/servers.json), whose suffix ends up in every detail_url
+        renderer = request.accepted_renderer
+        return (
+            representation_cache.enabled()
+            and isinstance(renderer, JSONRenderer)
+            and request.accepted_media_type == renderer.media_type
+            and not self.format_kwarg
+            and self.paginator is None
+        )
+
+    def _fragments(self, request, queryset, versions):
+        label = queryset.model._meta.model_name
+        base = request.build_absolute_uri('/')
+        fragments = representation_cache.get_many(label, versions, base)
+        missing = [pk for pk, _ in versions if pk not in fragments]
+        if missing:
+            rows = list(queryset.filter(pk__in=missing))
+            renderer = JSONRenderer()
+            rendered = {
+                row.pk: (row.version, renderer.render(data))
+                for row, data in zip(rows, self.get_serializer(rows, many=True).data)
+            }
+            representation_cache.set_many(label, rendered, base)
+            fragments.update((pk, fragment) for pk, (_, fragment) in rendered.items())
+        return fragments
+
+    def list(self, request, *args, **kwargs):
+        if not self._cacheable(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        versions = list(queryset.values_list('pk', 'version'))
+        fragments = self._fragments(request, queryset, versions)
+        # Rows deleted between the two queries are left out
+        body = b'[' + b','.join(fragments[pk] for pk, _ in versions if pk in fragments) + b']'
+        return HttpResponse(body, content_type=JSONRenderer.media_type)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self._cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        pk, version = get_object_or_404(queryset.values_list('pk', 'version'), **lookup)
+        fragment = self._fragments(request, queryset, [(pk, version)]).get(pk)
+        if fragment is None:
+            return super().retrieve(request, *args, **kwargs)
+        return HttpResponse(fragment, content_type=JSONRenderer.media_type)
+
+
+class DeviceViewSet(CachedRepresentationMixin, BulkCreateMixin, viewsets.ModelViewSet):
     '''
-    POST /api/devices/ - Register a device
+    POST /api/devices/ - Register a device, or a list of devices
     GET /api/devices/ - List devices
     PATCH /api/devices/{id} - Update a device's status
     '''
@@ -16,15 +114,41 @@ class DeviceViewSet(viewsets.ModelViewSet):
 
 
 
-class ServerViewSet(viewsets.ModelViewSet):
+class ServerViewSet(IdempotencyKeyMixin, CachedRepresentationMixin, BulkCreateMixin, viewsets.ModelViewSet):
     '''
-    POST /api/servers/ - Create a new server
+    POST /api/servers/ - Create a new server, or a list of servers
     GET /api/servers/ - List all servers
     GET /api/servers/{id} - Get a specific server's details
     PATCH /api/servers/{id} - Update a specific server's status
+    GET /api/servers/{id}/history - List a server's status transitions, newest first
+
+    POST and PATCH accept an Idempotency-Key header; retries with the same key
+    replay the first response instead of creating or transitioning again
     '''
     queryset = Server.objects.select_related('device').order_by('id')
     serializer_class = ServerSerializer
     permission_classes = [AllowAny]
     http_method_names = ['get', 'post', 'patch']
-                
+
+    @extend_schema(responses=ServerTransitionSerializer(many=True))
+    @action(
+        detail=True,
+        methods=['get'],
+        serializer_class=ServerTransitionSerializer,
+        pagination_class=TransitionPagination,
+    )
+    def history(self, request, pk=None):
+        server = self.get_object()
+        page = self.paginate_queryset(server.transitions.all())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class RepresentationCacheStatsView(generics.GenericAPIView):
+    '''
+    GET /api/cache-stats/ - Hit rate and bytes saved by the representation cache in this worker process
+    '''
+    serializer_class = RepresentationCacheStatsSerializer
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(self.get_serializer(representation_cache.stats()).data)
@@ -0,0 +1,21 @@
+from functools import lru_cache
+from pathlib import Path
+from django.conf import settings
+from django.http import HttpResponse
+
+
+@lru_cache(maxsize=1)
+def _read_schema(path):
+    return Path(path).read_bytes()
+
+
+def prebuilt_schema_view(request):
+    '''
+    GET /api/schema/ - Serves the OpenAPI schema generated at build time
+
+    The file is read once per process, so this costs no view introspection
+    '''
+    return HttpResponse(
+        _read_schema(str(settings.OPENAPI_SCHEMA_FILE)),
+        content_type='application/vnd.oai.openapi; charset=utf-8',
+    )
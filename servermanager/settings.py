@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,6 +30,12 @@ DEBUG = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't')
 
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 
+# Optional apps that are not needed to serve the API itself. Both default to on so
+# local development keeps the profiler and docs; production workers can turn them off
+# (or use servermanager.settings_api) to skip importing them at startup.
+ENABLE_DEV_TOOLS = os.environ.get('ENABLE_DEV_TOOLS', 'True').lower() in ('true', '1', 't')
+ENABLE_API_DOCS = os.environ.get('ENABLE_API_DOCS', 'True').lower() in ('true', '1', 't')
+
 
 # Application definition
 
@@ -38,12 +46,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'django_extensions',
     'api',
     'rest_framework',
-    'silk',
-    'drf_spectacular',
 ]
+if ENABLE_DEV_TOOLS:
+    INSTALLED_APPS += ['django_extensions', 'silk']
+if ENABLE_API_DOCS:
+    INSTALLED_APPS += ['drf_spectacular']
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -54,8 +63,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
 ]
+if ENABLE_DEV_TOOLS:
+    MIDDLEWARE += ['silk.middleware.SilkyMiddleware']
 
 ROOT_URLCONF = 'servermanager.urls'
 
@@ -139,12 +149,56 @@ STORAGES = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
+REST_FRAMEWORK = {}
+if ENABLE_API_DOCS:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+
+# How long a response stored under an Idempotency-Key can be replayed
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24')))
+
+# Most devices or servers one POST may register; larger loads go through import_fleet
+BULK_CREATE_MAX_ITEMS = int(os.environ.get('BULK_CREATE_MAX_ITEMS', '1000'))
+
+# Pools to try, in order, when a server's own pool has no online device,
+# e.g. POOL_FALLBACKS='{"us-east-1a": ["us-east-1b", "us-east-1c"]}'
+POOL_FALLBACKS = json.loads(os.environ.get('POOL_FALLBACKS', '{}'))
+
+# Server transition events are buffered per process and written in batches of this size,
+# or after this many seconds, whichever comes first
+TRANSITION_LOG_BATCH_SIZE = int(os.environ.get('TRANSITION_LOG_BATCH_SIZE', '100'))
+TRANSITION_LOG_FLUSH_SECONDS = float(os.environ.get('TRANSITION_LOG_FLUSH_SECONDS', '2'))
+# Age in days after which prune_transitions deletes events
+TRANSITION_LOG_RETENTION_DAYS = int(os.environ.get('TRANSITION_LOG_RETENTION_DAYS', '30'))
+
+# Pre-rendered JSON for device and server rows (api.representation_cache). Each process keeps
+# up to REPRESENTATION_CACHE_SIZE rows in an LRU, 0 turns it off. Setting REPRESENTATION_CACHE_URL,
+# e.g. redis://cache:6379/0 (needs the redis package), adds a cache shared by all processes.
+REPRESENTATION_CACHE_SIZE = int(os.environ.get('REPRESENTATION_CACHE_SIZE', '10000'))
+REPRESENTATION_CACHE_ALIAS = ''
+REPRESENTATION_CACHE_TIMEOUT = int(os.environ.get('REPRESENTATION_CACHE_TIMEOUT', '3600'))
+if os.environ.get('REPRESENTATION_CACHE_URL'):
+    REPRESENTATION_CACHE_ALIAS = 'representations'
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'representations': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REPRESENTATION_CACHE_URL'],
+        },
+    }
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Server Manager API',
     'DESCRIPTION': 'Backend API for managing servers and devices.',
     'VERSION': '1.0.0',
-}
\ No newline at end of file
+    # status, from_status and to_status share one enum in the schema
+    'ENUM_NAME_OVERRIDES': {'ServerStatusEnum': 'api.models.ServerStatus'},
+}
+
+# Schema written at build time by `manage.py spectacular --file openapi-schema.yml`.
+# With SERVE_PREBUILT_SCHEMA on and the file present it is served as-is instead of being
+# regenerated on every request. Off by default while the docs app is enabled, so local
+# development never serves a stale file.
+OPENAPI_SCHEMA_FILE = Path(os.environ.get('OPENAPI_SCHEMA_FILE', BASE_DIR / 'openapi-schema.yml'))
+SERVE_PREBUILT_SCHEMA = os.environ.get(
+    'SERVE_PREBUILT_SCHEMA', str(not ENABLE_API_DOCS)
+).lower() in ('true', '1', 't')
@@ -0,0 +1,48 @@
+"""
+API-only settings profile for production workers.
+
+Extends the default settings but drops everything the JSON API does not use:
+admin, sessions, messages, CSRF, the browsable API and the dev/doc apps. The schema
+is still available at /api/schema/ when the prebuilt OPENAPI_SCHEMA_FILE exists.
+
+Run with DJANGO_SETTINGS_MODULE=servermanager.settings_api
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+ENABLE_DEV_TOOLS = False
+ENABLE_API_DOCS = False
+SERVE_PREBUILT_SCHEMA = os.environ.get('SERVE_PREBUILT_SCHEMA', 'True').lower() in ('true', '1', 't')
+
+INSTALLED_APPS = [
+    'api',
+    'rest_framework',
+]
+
+# The API is stateless and unauthenticated, so session, CSRF, auth and message
+# middleware only add per-request work
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'UNAUTHENTICATED_USER': None,
+}
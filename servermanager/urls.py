@@ -14,19 +14,32 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
+from django.conf import settings
 from django.urls import include, path
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from servermanager.schema import prebuilt_schema_view
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+]
 
-    # Silk
-    path('silk/', include('silk.urls', namespace='silk')),
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns += [path('admin/', admin.site.urls)]
 
-    # Spectacular
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-]
+# Silk
+if apps.is_installed('silk'):
+    urlpatterns += [path('silk/', include('silk.urls', namespace='silk'))]
+
+# Spectacular - production workers serve the schema generated at build time instead of
+# introspecting the views per request; development keeps the live schema
+if settings.SERVE_PREBUILT_SCHEMA and settings.OPENAPI_SCHEMA_FILE.exists():
+    urlpatterns += [path('api/schema/', prebuilt_schema_view, name='schema')]
+elif apps.is_installed('drf_spectacular'):
+    from drf_spectacular.views import SpectacularAPIView
+    urlpatterns += [path('api/schema/', SpectacularAPIView.as_view(), name='schema')]
+
+if apps.is_installed('drf_spectacular'):
+    from drf_spectacular.views import SpectacularSwaggerView
+    urlpatterns += [path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui')]